@@ -14,138 +14,187 @@ def aggregate_features_across_chains(
     features: Output[Artifact],
 ):
     """Aggregates features across chains for multimer prediction."""
+    import hashlib
     import pickle
-    import tempfile
     import json
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import urlparse
+    from google.api_core.exceptions import NotFound
     from google.cloud import storage
     import logging
+    import requests
+    from alphafold.common import protein
+    from alphafold.common import residue_constants
     from alphafold.data import feature_processing, pipeline_multimer
+    from alphafold_utils import FEATURES_FORMAT_VERSION
+    from alphafold_utils import compress_features, decompress_features, quantize_features
     import os
     import numpy as np
 
     storage_client = storage.Client()
+    # The default pool keeps 10 connections, which would throttle the
+    # concurrent chain downloads below
+    storage_client._http.mount(
+        'https://', requests.adapters.HTTPAdapter(pool_connections=64, pool_maxsize=64))
     
     # Load all chain features from GCS
     all_chain_features = {}
-    chain_info = sequences.metadata['chain_info']
     
     # Parse the features paths from JSON
     paths_info = json.loads(per_chain_features_dir)
+
+    # create_run_id serializes the chains with sorted keys, so restore the
+    # FASTA order. Chain IDs are assigned from protein.PDB_CHAIN_IDS
+    # (A-Z, a-z, 0-9), which ASCII order does not follow.
+    chain_paths = sorted(
+        paths_info['chains'].items(),
+        key=lambda item: protein.PDB_CHAIN_IDS.index(item[0]))
+
+    # Resolve each chain's features URI to (bucket, blob path) in one pass
+    chain_blob_paths = {
+        chain_id: (parsed_path.netloc, parsed_path.path.lstrip('/') + '/features.pkl')
+        for chain_id, features_path in chain_paths
+        for parsed_path in [urlparse(features_path)]
+    }
     
-    # Helper function to print shapes of key features
-    def print_feature_shapes(chain_id, features_dict, prefix=""):
-        # This function prints the shapes of some critical arrays
+    # Helper function to log shapes of key features at debug level
+    def log_feature_shapes(chain_id, features_dict, stage):
+        # Skip building the shapes dict entirely unless debug logging is on
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return
         keys_to_check = [
             'msa', 'msa_all_seq', 'template_aatype', 'aatype', 
             'num_alignments', 'num_alignments_all_seq'
         ]
-        print(f"{prefix}Feature shapes for chain {chain_id}:")
-        for key in keys_to_check:
-            if key in features_dict:
-                val = features_dict[key]
-                if isinstance(val, np.ndarray):
-                    print(f"  {key}: shape {val.shape}")
-                else:
-                    print(f"  {key}: not an array (type: {type(val)})")
-            else:
-                print(f"  {key}: not found in features")
-        print("-------------------------------------------------")
-
-    for chain_data in chain_info:
-        chain_id = chain_data['chain_id']
-        
-        # Get the features path for this chain
-        if chain_id not in paths_info['chains']:
-            raise ValueError(f"No path information found for chain {chain_id}")
-            
-        features_path = paths_info['chains'][chain_id]
-        
-        # Parse bucket and blob path
-        bucket_name = features_path.replace('gs://', '').split('/')[0]
-        blob_path = '/'.join(features_path.replace('gs://', '').split('/')[1:]) + '/features.pkl'
-        
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_path)
+        shapes = {
+            key: getattr(features_dict[key], 'shape', type(features_dict[key]))
+            for key in keys_to_check if key in features_dict
+        }
+        logging.debug("%s: chain=%s shapes=%s", stage, chain_id, shapes)
+
+    # HHblits -> AlphaFold residue order, built once for all chains
+    template_aatype_lut = np.asarray(
+        residue_constants.MAP_HHBLITS_AATYPE_TO_OUR_AATYPE, dtype=np.int32)
+    leading_dim_features = frozenset(
+        {'sequence', 'domain_name', 'num_alignments', 'seq_length'})
+
+    # Equivalent of pipeline_multimer.convert_monomer_features that reuses
+    # the lookup table instead of rebuilding it from a list per chain
+    def convert_monomer_features(monomer_features, chain_id):
+        converted = {'auth_chain_id': np.asarray(chain_id, dtype=np.object_)}
+        for feature_name, feature in monomer_features.items():
+            if feature_name in leading_dim_features:
+                feature = np.asarray(feature[0], dtype=feature.dtype)
+            elif feature_name == 'aatype':
+                # The multimer model performs the one-hot operation itself
+                feature = np.argmax(feature, axis=-1).astype(np.int32)
+            elif feature_name == 'template_aatype':
+                feature = template_aatype_lut[np.argmax(feature, axis=-1)]
+            elif feature_name == 'template_all_atom_masks':
+                feature_name = 'template_all_atom_mask'
+            converted[feature_name] = feature
+        return converted
+
+    # Download a single chain's features from GCS and convert them to
+    # multimer format, overlapping the conversion with other downloads
+    def download_chain_features(task):
+        chain_id, blob = task
         
-        if not blob.exists():
-            raise FileNotFoundError(f"Features file not found in GCS for chain {chain_id}: gs://{bucket_name}/{blob_path}")
+        try:
+            chain_features = decompress_features(
+                pickle.loads(blob.download_as_bytes(raw_download=True)))
+        except NotFound as e:
+            raise FileNotFoundError(f"Features file not found in GCS for chain {chain_id}: gs://{blob.bucket.name}/{blob.name}") from e
+        log_feature_shapes(chain_id, chain_features, "Before monomer processing")
         
-        # Download and process features
-        with tempfile.NamedTemporaryFile() as temp_file:
-            blob.download_to_filename(temp_file.name)
-            with open(temp_file.name, 'rb') as f:
-                chain_features = pickle.load(f)
-                print(f"Chain features keys before monomer processing: {chain_features.keys()}")
-                
-                # Print shapes before monomer processing
-                print_feature_shapes(chain_id, chain_features, prefix="Before monomer processing:")
-                
-                # Convert monomer features to multimer format
-                chain_features = pipeline_multimer.convert_monomer_features(
-                    monomer_features=chain_features,
-                    chain_id=chain_id
-                )
-                print(f"Chain features keys after monomer processing: {chain_features.keys()}")
-                
-                # Print shapes after monomer processing
-                print_feature_shapes(chain_id, chain_features, prefix="After monomer processing:")
-
-                all_chain_features[chain_id] = chain_features
+        chain_features = convert_monomer_features(
+            monomer_features=chain_features,
+            chain_id=chain_id
+        )
+        log_feature_shapes(chain_id, chain_features, "After monomer processing")
+        return chain_features
+
+    download_tasks = [
+        (chain_id, storage_client.bucket(bucket_name).blob(blob_path))
+        for chain_id, (bucket_name, blob_path) in chain_blob_paths.items()
+    ]
+
+    # Fetch every chain's object metadata in a single batched request. The
+    # reloaded generations also pin the downloads below to the same objects.
+    try:
+        with storage_client.batch():
+            for _, blob in download_tasks:
+                blob.reload()
+    except NotFound as e:
+        raise FileNotFoundError(f"Features file not found in GCS for one or more chains: {str(e)}") from e
+
+    # Key the merged features on the exact chain objects they are built from
+    # and on the version of the code that merges and serializes them
+    cache_key = hashlib.sha256(json.dumps({
+        'format_version': FEATURES_FORMAT_VERSION,
+        'is_homomer_or_monomer': is_homomer_or_monomer,
+        'chains': [
+            [chain_id, blob.bucket.name, blob.name, blob.generation]
+            for chain_id, blob in download_tasks
+        ],
+    }, sort_keys=True).encode()).hexdigest()
+    features_file_name = f'all_chain_features_{cache_key}.pkl'
+
+    # Use the full protein features path from paths_info if available
+    if 'full_protein' in paths_info:
+        output_features_path = paths_info['full_protein']
+    
+    parsed_output_path = urlparse(output_features_path)
+    dest_bucket_name = parsed_output_path.netloc
+    dest_prefix = parsed_output_path.path.lstrip('/')
+    dest_blob_path = os.path.join(dest_prefix, features_file_name)
+    dest_bucket = storage_client.bucket(dest_bucket_name)
+    dest_blob = dest_bucket.blob(dest_blob_path)
+
+    features.metadata = {
+        'is_homomer_or_monomer': is_homomer_or_monomer,
+        'num_chains': len(download_tasks)
+    }
+
+    # Skip downloading and merging if these chains were already aggregated
+    if dest_blob.exists():
+        features.uri = os.path.join(output_features_path, features_file_name)
+        logging.info(f"Reusing aggregated features at: {features.uri}")
+        return
+
+    # Downloads are latency bound, so fetch all chains concurrently
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(download_tasks)))) as executor:
+        downloaded_features = list(executor.map(download_chain_features, download_tasks))
+
+    for (chain_id, _), chain_features in zip(download_tasks, downloaded_features):
+        all_chain_features[chain_id] = chain_features
     
     # Add assembly features
     all_chain_features = pipeline_multimer.add_assembly_features(all_chain_features)
 
-    # Print shapes after adding assembly features
-    for cid, feats in all_chain_features.items():
-        print_feature_shapes(cid, feats, prefix="After assembly features:")
-
     if is_homomer_or_monomer == 'true' and len(all_chain_features) == 1:
         # For monomers, just use the single chain features
         chain_id = next(iter(all_chain_features))
         np_example = all_chain_features[chain_id]
     else:
         # For multimers, pair and merge the features
-        print(f"Pairing and merging {len(all_chain_features)} chains")
-        print(f"All chain features keys: {all_chain_features.keys()}")
-
-        # Print shapes before pair_and_merge
-        for cid, feats in all_chain_features.items():
-            print_feature_shapes(cid, feats, prefix="Before pair_and_merge:")
+        logging.info(f"Pairing and merging {len(all_chain_features)} chains")
 
         np_example = feature_processing.pair_and_merge(
             all_chain_features=all_chain_features)
+        log_feature_shapes("merged", np_example, "After pair_and_merge")
         
-        # Print shapes after pair_and_merge
-        print_feature_shapes("merged", np_example, prefix="After pair_and_merge:")
-        
-        print_feature_shapes("merged", np_example, prefix="Before pad_msa:")
-        np_example = pipeline_multimer.pad_msa(np_example, 512)
-        print_feature_shapes("merged", np_example, prefix="After pad_msa:")
-        
-    # Use the full protein features path from paths_info if available
-    if 'full_protein' in paths_info:
-        output_features_path = paths_info['full_protein']
-    
     # Save merged features to GCS
-    dest_bucket_name = output_features_path.replace('gs://', '').split('/')[0]
-    dest_prefix = '/'.join(output_features_path.replace('gs://', '').split('/')[1:])
-    dest_blob_path = os.path.join(dest_prefix, 'all_chain_features.pkl')
-    dest_bucket = storage_client.bucket(dest_bucket_name)
-    dest_blob = dest_bucket.blob(dest_blob_path)
-    
+    payload = pickle.dumps(
+        compress_features(quantize_features(np_example)),
+        protocol=pickle.HIGHEST_PROTOCOL)
     try:
-        with tempfile.NamedTemporaryFile() as temp_file:
-            with open(temp_file.name, 'wb') as f:
-                pickle.dump(np_example, f, protocol=4)
-            dest_blob.upload_from_filename(temp_file.name)
+        dest_blob.upload_from_string(
+            payload, content_type='application/octet-stream', checksum='crc32c')
     except Exception as e:
         raise RuntimeError(f"Failed to save features to GCS at {output_features_path}: {str(e)}")
     
-    features.uri = os.path.join(output_features_path, 'all_chain_features.pkl')
-    features.metadata = {
-        'is_homomer_or_monomer': is_homomer_or_monomer,
-        'num_chains': len(all_chain_features)
-    }
+    features.uri = os.path.join(output_features_path, features_file_name)
 
     # Print debug information
     logging.info(f"Successfully processed {len(all_chain_features)} chains")
@@ -179,7 +179,7 @@ def aggregate_features_multimer(
         
         # Save features locally first
         with open(local_features_path, 'wb') as f:
-            pickle.dump(model_features, f, protocol=4)
+            pickle.dump(model_features, f, protocol=pickle.HIGHEST_PROTOCOL)
         
         # Parse the features path from the per_chain_features_dir (which is the JSON from create_run_id)
         paths_info = json.loads(per_chain_features_dir)
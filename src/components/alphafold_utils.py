@@ -20,7 +20,7 @@ import os
 import pickle
 import shutil
 import time
-from typing import Dict, List, Mapping, Sequence, Tuple
+from typing import BinaryIO, Dict, List, Mapping, Sequence, Tuple
 
 from alphafold.common import protein
 from alphafold.common import residue_constants
@@ -40,6 +40,7 @@ from alphafold.model import model
 from alphafold.relax import relax
 
 
+import blosc2
 import numpy as np
 
 
@@ -51,13 +52,90 @@ KALIGN_BINARY_PATH = shutil.which('kalign')
 HMMBUILD_BINARY_PATH = shutil.which('hmmbuild')
 
 MAX_TEMPLATE_HITS = 20
+MULTIMER_MIN_NUM_SEQ = 512
+
+# MSA and template arrays use a small alphabet and compress well once
+# bit-shuffled.
+FEATURES_CPARAMS = {
+    'codec': blosc2.Codec.ZSTD,
+    'clevel': 3,
+    'filters': [blosc2.Filter.BITSHUFFLE],
+}
+
+# Version of the merged features layout and merge logic. Part of the
+# aggregated features cache key; bump it whenever either changes so stale
+# cached features are not reused.
+FEATURES_FORMAT_VERSION = 1
+
+# Integer features persisted in narrower dtypes and widened back to int32
+# on load.
+QUANTIZED_FEATURE_DTYPES = {
+    'msa': np.uint8,
+    'msa_all_seq': np.uint8,
+    'aatype': np.uint8,
+    'template_aatype': np.uint8,
+    'deletion_matrix_int': np.uint16,
+    'deletion_matrix_int_all_seq': np.uint16,
+}
+
+
+def quantize_features(
+    features: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Downcasts integer features whose values fit a narrower dtype."""
+    quantized = dict(features)
+    for name, dtype in QUANTIZED_FEATURE_DTYPES.items():
+        value = quantized.get(name)
+        if (value is None or value.dtype.kind not in 'iu'
+                or value.size == 0):
+            continue
+        if value.min() >= 0 and value.max() <= np.iinfo(dtype).max:
+            quantized[name] = value.astype(dtype)
+    return quantized
+
+
+def compress_features(features: Mapping[str, np.ndarray]) -> Dict:
+    """Blosc2-compresses the non-empty numeric arrays of a feature dict."""
+    # pack_tensor cannot handle zero-size or non C-contiguous arrays, so
+    # empty arrays stay in-band and the rest are made contiguous first.
+    return {
+        name: blosc2.pack_tensor(
+            np.ascontiguousarray(value), cparams=FEATURES_CPARAMS)
+        if (isinstance(value, np.ndarray) and value.dtype.kind in 'biuf'
+            and value.size)
+        else value
+        for name, value in features.items()
+    }
+
+
+def decompress_features(features: Mapping) -> Dict[str, np.ndarray]:
+    """Restores arrays packed by compress_features and quantize_features.
+
+    Plain feature dicts pass through unchanged.
+    """
+    decompressed = {}
+    for name, value in features.items():
+        if isinstance(value, bytes):
+            value = blosc2.unpack_tensor(value)
+        if (name in QUANTIZED_FEATURE_DTYPES
+                and value.dtype == QUANTIZED_FEATURE_DTYPES[name]):
+            value = value.astype(np.int32)
+        decompressed[name] = value
+    return decompressed
+
+
+def _pad_merged_msa(features: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Pads merged multimer MSAs, which are persisted unpadded."""
+    # Only pair_and_merge output carries cluster_bias_mask.
+    if 'cluster_bias_mask' not in features:
+        return features
+    return pipeline_multimer.pad_msa(features, MULTIMER_MIN_NUM_SEQ)
 
 
 def _load_features(features_path: str) -> Dict[str, str]:
     """Loads pickeled features."""
     with open(features_path, 'rb') as f:
         features = pickle.load(f)
-    return features
+    return _pad_merged_msa(decompress_features(features))
 
 
 def _read_msa(msa_path: str, msa_format: str) -> str:
@@ -161,7 +239,7 @@ def run_data_pipeline(
     )
 
     with open(features_output_path, 'wb') as f:
-        pickle.dump(feature_dict, f, protocol=4)
+        pickle.dump(feature_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     msas_metadata = {}
     paths = glob.glob(os.path.join(msa_output_path, '**'), recursive=True)
@@ -197,7 +275,7 @@ def run_data_pipeline(
 
 
 def predict(
-    model_features_path: str,
+    model_features_fileobj: BinaryIO,
     model_params_path: str,
     model_name: str,
     num_ensemble: int,
@@ -220,7 +298,8 @@ def predict(
         model_name=model_name, data_dir=model_params_path)
     model_runner = model.RunModel(model_config, model_params)
 
-    features = _load_features(model_features_path)
+    features = _pad_merged_msa(
+        decompress_features(pickle.load(model_features_fileobj)))
     processed_feature_dict = model_runner.process_features(
         raw_features=features,
         random_seed=random_seed)
@@ -230,7 +309,7 @@ def predict(
         random_seed=random_seed)
 
     with open(raw_prediction_path, 'wb') as f:
-        pickle.dump(prediction_result, f, protocol=4)
+        pickle.dump(prediction_result, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     plddt = prediction_result['plddt']
     plddt_b_factors = np.repeat(
@@ -362,7 +441,7 @@ def predict_relax(
         result_output_path = os.path.join(
             raw_prediction_path, f'result_{model_name}.pkl')
         with open(result_output_path, 'wb') as f:
-            pickle.dump(prediction_result, f, protocol=4)
+            pickle.dump(prediction_result, f, protocol=pickle.HIGHEST_PROTOCOL)
 
         # Add the predicted LDDT in the b-factor column.
         # Note that higher predicted LDDT value means higher model confidence.
@@ -431,7 +510,7 @@ def aggregate(
         **template_features
     }
     with open(output_features_path, 'wb') as f:
-        pickle.dump(model_features, f, protocol=4)
+        pickle.dump(model_features, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     return model_features
 
@@ -535,7 +614,8 @@ def run_hhsearch(
         query_sequence=sequence,
         hits=template_hits)
     with open(template_features_path, 'wb') as f:
-        pickle.dump(templates_result.features, f, protocol=4)
+        pickle.dump(templates_result.features, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
 
     return parsers.parse_hhr(hhr_str), templates_result.features
 
@@ -592,6 +672,7 @@ def run_hmmsearch(
         hits=template_hits)
 
     with open(template_features_path, 'wb') as f:
-        pickle.dump(templates_result.features, f, protocol=4)
+        pickle.dump(templates_result.features, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
 
     return parsers.parse_stockholm(sto_str), templates_result.features
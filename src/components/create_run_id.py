@@ -20,7 +20,6 @@ def create_run_id(
     """Creates a unique run ID based on sequence content and parameters."""
     import hashlib
     import json
-    import tempfile
     from google.cloud import storage
     from typing import Dict, List
     from alphafold.data import parsers
@@ -38,14 +37,8 @@ def create_run_id(
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_path)
     
-    # Create a temporary file to store the sequence
-    with tempfile.NamedTemporaryFile(mode='w+') as temp_file:
-        # Download the content to the temporary file
-        blob.download_to_filename(temp_file.name)
-        
-        # Read sequence content
-        with open(temp_file.name, 'r') as f:
-            sequence_content = f.read()
+    # Read sequence content
+    sequence_content = blob.download_as_text()
     
     # Parse the sequences using AlphaFold's parser
     seqs, seq_descs = parsers.parse_fasta(sequence_content)
@@ -64,6 +57,19 @@ def create_run_id(
         # Notice we intentionally omit skip_msa here
     }
 
+    # Check the output bucket once rather than for every chain
+    out_bucket = storage_client.bucket(project)
+    # Create bucket if it doesn't exist
+    if not out_bucket.exists():
+        try:
+            out_bucket = storage_client.create_bucket(
+                project,
+                location="us-central1"
+            )
+            print(f"Bucket {project} created")
+        except Exception as e:
+            print(f"Error creating bucket: {str(e)}")
+
     # Function to compute hash and check blob existence
     def compute_hash_and_check(params: dict, sequence_str: str, prefix: str):
         params_copy = params.copy()
@@ -72,19 +78,6 @@ def create_run_id(
         hash_object = hashlib.sha256(params_str.encode())
         current_hash = hash_object.hexdigest()
         path = f"gs://{project}/{prefix}/{current_hash}"
-
-        # Check if blob exists
-        out_bucket = storage_client.bucket(project)
-        # Create bucket if it doesn't exist
-        if not out_bucket.exists():
-            try:
-                out_bucket = storage_client.create_bucket(
-                    project,
-                    location="us-central1"
-                )
-                print(f"Bucket {project} created")
-            except Exception as e:
-                print(f"Error creating bucket: {str(e)}")
         
         # The path is a directory; actual file might be `features.pkl` or MSA files.
         # We'll just check if there's any blob starting with this prefix.
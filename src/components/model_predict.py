@@ -43,10 +43,10 @@ def predict(
   import logging
   import time
   import os
-  from google.cloud import storage
   import tempfile
-
-  from alphafold_utils import predict as alphafold_predict
+  from concurrent.futures import ThreadPoolExecutor
+  from google.cloud import storage
+  from urllib.parse import urlparse
 
   os.environ['TF_FORCE_UNIFIED_MEMORY'] = tf_force_unified_memory
   os.environ['XLA_PYTHON_CLIENT_MEM_FRACTION'] = xla_python_client_mem_fraction
@@ -54,35 +54,53 @@ def predict(
   logging.info(f'Starting model prediction {prediction_index} using model {model_name}...')
   t0 = time.time()
   
-  random_seed = int(random_seed)
-  # Download model features from GCS if it's a GCS path
+  # Start downloading model features from GCS if it's a GCS path, so the
+  # transfer overlaps the AlphaFold import below. The features go to a local
+  # file rather than memory so only the unpickled copy is held in RAM.
+  features_future = None
+  downloaded_features_path = None
   if model_features.uri.startswith('gs://'):
     storage_client = storage.Client()
-    bucket_name = model_features.uri.replace('gs://', '').split('/')[0]
-    blob_path = '/'.join(model_features.uri.replace('gs://', '').split('/')[1:])
+    parsed_uri = urlparse(model_features.uri)
+    bucket_name = parsed_uri.netloc
+    blob_path = parsed_uri.path.lstrip('/')
         
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_path)
-        
     with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        blob.download_to_filename(temp_file.name)
-        model_features_path = temp_file.name
-        logging.info(f'Downloaded model features to temporary file: {model_features_path}')
-  else:
-    model_features_path = model_features.path
+      downloaded_features_path = temp_file.name
+    executor = ThreadPoolExecutor(max_workers=1)
+    features_future = executor.submit(
+        blob.download_to_filename, downloaded_features_path)
+    executor.shutdown(wait=False)
+
+  from alphafold_utils import predict as alphafold_predict
 
+  random_seed = int(random_seed)
   raw_prediction.uri = f'{raw_prediction.uri}.pkl'
   unrelaxed_protein.uri = f'{unrelaxed_protein.uri}.pdb'
-  prediction_result = alphafold_predict(
-      model_features_path=model_features_path,
-      model_params_path=model_params.path,
-      model_name=model_name,
-      num_ensemble=num_ensemble,
-      run_multimer_system=run_multimer_system,
-      random_seed=random_seed,
-      raw_prediction_path=raw_prediction.path,
-      unrelaxed_protein_path=unrelaxed_protein.path
-  )
+  try:
+    if features_future is not None:
+      features_future.result()
+      model_features_path = downloaded_features_path
+      logging.info(f'Downloaded model features to temporary file: {model_features_path}')
+    else:
+      model_features_path = model_features.path
+
+    with open(model_features_path, 'rb') as model_features_file:
+      prediction_result = alphafold_predict(
+          model_features_fileobj=model_features_file,
+          model_params_path=model_params.path,
+          model_name=model_name,
+          num_ensemble=num_ensemble,
+          run_multimer_system=run_multimer_system,
+          random_seed=random_seed,
+          raw_prediction_path=raw_prediction.path,
+          unrelaxed_protein_path=unrelaxed_protein.path
+      )
+  finally:
+    if downloaded_features_path is not None:
+      os.remove(downloaded_features_path)
 
   raw_prediction.metadata['category'] = 'raw_prediction'
   raw_prediction.metadata['prediction_index'] = prediction_index